@@ -3,12 +3,16 @@ import aiohttp
 import json
 import asyncio
 import random
+import time
 from datetime import datetime, timedelta
 import pytz
 from telegram import Update, BotCommand
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackContext, JobQueue
 from config import API_KEY, TELEGRAM_BOT_TOKEN, YOUR_SITE_URL, YOUR_APP_NAME, ALLOWED_USER_IDS
+from config import RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_PATH, USAGE_LEDGER_PATH
 from personalities import personalities
+from response_cache import ResponseCache, make_cache_key
+from usage_ledger import UsageLedger
 
 # 启用日志记录
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.DEBUG)
@@ -32,12 +36,42 @@ message_ids = {}
 user_reminders = {}
 # 存储每个用户的循环提醒
 user_daily_reminders = {}
+# 相同请求的API响应缓存
+response_cache = ResponseCache(ttl=RESPONSE_CACHE_TTL, max_bytes=RESPONSE_CACHE_MAX_BYTES, path=RESPONSE_CACHE_PATH)
+# API调用的token用量和延迟记录
+usage_ledger = UsageLedger(path=USAGE_LEDGER_PATH)
 
 
 # 获取最新的人格选择
 def get_latest_personality(chat_id):
     return user_personalities.get(chat_id, "DefaultPersonality")
 
+# 向API发送请求并返回响应JSON，对启用缓存的人格先查找缓存，并记录用量
+# refresh=True 时跳过缓存查找，但仍用新的响应覆盖缓存
+async def post_chat_completion(session, personality, headers, payload, chat_id, personality_name, call_site, refresh=False):
+    use_cache = personality.get('cache', False)
+    if use_cache:
+        cache_key = make_cache_key(payload['model'], payload['temperature'], payload['messages'])
+        cached_response = None if refresh else response_cache.get(cache_key)
+        if cached_response is not None:
+            logger.debug(f"响应缓存命中: {cache_key}")
+            usage_ledger.record(call_site, chat_id, personality_name, payload['model'], cached=True)
+            return cached_response
+
+    start_time = time.monotonic()
+    try:
+        async with session.post(personality['api_url'], headers=headers, json=payload) as response:
+            response.raise_for_status()  # 检查HTTP请求是否成功
+            response_json = await response.json()
+    except Exception:
+        usage_ledger.record(call_site, chat_id, personality_name, payload['model'], latency=time.monotonic() - start_time, error=True)
+        raise
+    usage_ledger.record(call_site, chat_id, personality_name, payload['model'], response_json.get('usage'), time.monotonic() - start_time)
+
+    if use_cache and response_json.get('choices'):
+        response_cache.set(cache_key, response_json)
+    return response_json
+
 # 装饰器函数来检查用户ID
 def allowed_users_only(func):
     async def wrapper(update: Update, context: CallbackContext):
@@ -194,7 +228,7 @@ async def retry_last_response(update: Update, context: CallbackContext) -> None:
                             logger.error(f"删除消息失败: {delete_err}")
 
                     # 检查记忆的相关性并重新请求API响应
-                    await process_message(chat_id, last_user_message, update.message, context)
+                    await process_message(chat_id, last_user_message, update.message, context, refresh=True)
 
                 else:
                     await context.bot.send_message(chat_id=chat_id, text="未找到对应的用户消息。")
@@ -309,6 +343,27 @@ async def clear_daily_clock(update: Update, context: CallbackContext) -> None:
         await update.message.reply_text('无效的提醒索引。')
 
 
+# /cachestats 命令的处理函数
+@allowed_users_only
+async def cache_stats(update: Update, context: CallbackContext) -> None:
+    stats = response_cache.stats()
+    enabled = [name for name, personality in personalities.items() if personality.get('cache', False)]
+    await update.message.reply_text(
+        f"响应缓存统计：\n"
+        f"启用缓存的人格: {', '.join(enabled) if enabled else '无'}\n"
+        f"条目数: {stats['entries']}\n"
+        f"占用: {stats['bytes']} / {stats['max_bytes']} 字节\n"
+        f"命中: {stats['hits']}，未命中: {stats['misses']}，命中率: {stats['hit_rate']:.1%}\n"
+        f"淘汰: {stats['evictions']}"
+    )
+
+
+# /usage 命令的处理函数
+@allowed_users_only
+async def usage_report(update: Update, context: CallbackContext) -> None:
+    await update.message.reply_text(f"用量统计（自启动以来）：\n{usage_ledger.summary.report()}")
+
+
 # 消息处理函数
 @allowed_users_only
 async def handle_message(update: Update, context: CallbackContext) -> None:
@@ -344,8 +399,8 @@ async def handle_message(update: Update, context: CallbackContext) -> None:
 
     await process_message(chat_id, message, update.message, context)
 
-# 处理消息的函数，包括记忆检查
-async def process_message(chat_id, message, telegram_message, context):
+# 处理消息的函数，包括记忆检查；refresh=True 时不使用缓存的回复（用于 /retry）
+async def process_message(chat_id, message, telegram_message, context, refresh=False):
     # 获取当前的人格选择
     current_personality = get_latest_personality(chat_id)
 
@@ -379,12 +434,10 @@ async def process_message(chat_id, message, telegram_message, context):
 
         async with aiohttp.ClientSession() as session:
             try:
-                async with session.post(personality['api_url'], headers=headers, json=memory_check_payload) as memory_check_response:
-                    memory_check_response.raise_for_status()
-                    memory_check_result = await memory_check_response.json()
-                    logger.debug(f"chat_id {chat_id} 的记忆检查API响应: {memory_check_result}")
+                memory_check_result = await post_chat_completion(session, personality, headers, memory_check_payload, chat_id, current_personality, 'memory_check')
+                logger.debug(f"chat_id {chat_id} 的记忆检查API响应: {memory_check_result}")
 
-                    memory_check_result = memory_check_result.get('choices', [{}])[0].get('message', {}).get('content', '').strip()
+                memory_check_result = memory_check_result.get('choices', [{}])[0].get('message', {}).get('content', '').strip()
             except aiohttp.ClientResponseError as http_err:
                 logger.error(f"HTTP 错误发生: {http_err}")
                 memory_check_result = "2"
@@ -422,12 +475,10 @@ async def process_message(chat_id, message, telegram_message, context):
 
     async with aiohttp.ClientSession() as session:
         try:
-            async with session.post(personality['api_url'], headers=headers, json=final_payload) as response:
-                response.raise_for_status()  # 检查HTTP请求是否成功
-                response_json = await response.json()
-                logger.debug(f"chat_id {chat_id} 的API响应: {response_json}")
+            response_json = await post_chat_completion(session, personality, headers, final_payload, chat_id, current_personality, 'chat', refresh=refresh)
+            logger.debug(f"chat_id {chat_id} 的API响应: {response_json}")
 
-                reply = response_json.get('choices', [{}])[0].get('message', {}).get('content', '').strip()
+            reply = response_json.get('choices', [{}])[0].get('message', {}).get('content', '').strip()
         except aiohttp.ClientResponseError as http_err:
             logger.error(f"HTTP 错误发生: {http_err}")
             reply = f"HTTP 错误发生: {http_err}"
@@ -520,26 +571,24 @@ async def send_reminder(chat_id, reminder_text, context: CallbackContext):
 
     async with aiohttp.ClientSession() as session:
         try:
-            async with session.post(personality['api_url'], headers=headers, json=payload) as response:
-                response.raise_for_status()
-                response_json = await response.json()
-                reply = response_json.get('choices', [{}])[0].get('message', {}).get('content', '').strip()
-                if "：" in reply:
-                    reply = reply.split("：", 1)[-1].strip()
-                sent_message = await context.bot.send_message(chat_id=chat_id, text=reply)
-                # 将提醒内容和回复内容添加到聊天历史
-                if chat_id not in chat_histories:
-                    chat_histories[chat_id] = []
-                chat_histories[chat_id].append(f"Reminder: {reminder_text}")
-                chat_histories[chat_id].append(f"Bot: {reply}")
-
-                # 记录消息ID
-                if chat_id not in message_ids:
-                    message_ids[chat_id] = []
-                message_ids[chat_id].append(sent_message.message_id)
-
-                last_activity[chat_id] = datetime.now()  # 更新最后活动时间
-                logger.info(f"向 chat_id {chat_id} 发送了提醒: {reply}")
+            response_json = await post_chat_completion(session, personality, headers, payload, chat_id, current_personality, 'reminder')
+            reply = response_json.get('choices', [{}])[0].get('message', {}).get('content', '').strip()
+            if "：" in reply:
+                reply = reply.split("：", 1)[-1].strip()
+            sent_message = await context.bot.send_message(chat_id=chat_id, text=reply)
+            # 将提醒内容和回复内容添加到聊天历史
+            if chat_id not in chat_histories:
+                chat_histories[chat_id] = []
+            chat_histories[chat_id].append(f"Reminder: {reminder_text}")
+            chat_histories[chat_id].append(f"Bot: {reply}")
+
+            # 记录消息ID
+            if chat_id not in message_ids:
+                message_ids[chat_id] = []
+            message_ids[chat_id].append(sent_message.message_id)
+
+            last_activity[chat_id] = datetime.now()  # 更新最后活动时间
+            logger.info(f"向 chat_id {chat_id} 发送了提醒: {reply}")
         except aiohttp.ClientResponseError as http_err:
             logger.error(f"HTTP 错误发生: {http_err}")
         except aiohttp.ClientError as req_err:
@@ -613,20 +662,18 @@ async def greeting_scheduler(chat_id, context: CallbackContext):
 
                 async with aiohttp.ClientSession() as session:
                     try:
-                        async with session.post(personality['api_url'], headers=headers, json=payload) as response:
-                            response.raise_for_status()
-                            response_json = await response.json()
-                            logger.debug(f"chat_id {chat_id} 的API响应: {response_json}")
-
-                            reply = response_json.get('choices', [{}])[0].get('message', {}).get('content', '').strip()
-                            if "：" in reply:
-                                reply = reply.split("：", 1)[-1].strip()
-                            await context.bot.send_message(chat_id=chat_id, text=reply)
-
-                            # 将主动问候添加到聊天历史
-                            chat_histories[chat_id].append(f"Bot: {reply}")
-                            last_activity[chat_id] = datetime.now()  # 更新最后活动时间
-                            logger.info(f"向 chat_id {chat_id} 发送了问候: {reply}")
+                        response_json = await post_chat_completion(session, personality, headers, payload, chat_id, current_personality, 'greeting')
+                        logger.debug(f"chat_id {chat_id} 的API响应: {response_json}")
+
+                        reply = response_json.get('choices', [{}])[0].get('message', {}).get('content', '').strip()
+                        if "：" in reply:
+                            reply = reply.split("：", 1)[-1].strip()
+                        await context.bot.send_message(chat_id=chat_id, text=reply)
+
+                        # 将主动问候添加到聊天历史
+                        chat_histories[chat_id].append(f"Bot: {reply}")
+                        last_activity[chat_id] = datetime.now()  # 更新最后活动时间
+                        logger.info(f"向 chat_id {chat_id} 发送了问候: {reply}")
                     except aiohttp.ClientResponseError as http_err:
                         logger.error(f"HTTP 错误发生: {http_err}")
                     except aiohttp.ClientError as req_err:
@@ -636,6 +683,14 @@ async def greeting_scheduler(chat_id, context: CallbackContext):
                     except Exception as err:
                         logger.error(f"发生错误: {err}")
 
+# 定期将响应缓存保存到磁盘
+async def save_response_cache(context: CallbackContext):
+    response_cache.save()
+
+# 定期将用量记录写入磁盘
+async def flush_usage_ledger(context: CallbackContext):
+    usage_ledger.flush()
+
 # 主函数
 def main() -> None:
     application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
@@ -652,7 +707,9 @@ def main() -> None:
         BotCommand("clocklist", "查看提醒列表"),
         BotCommand("clockeveryday", "设置每日提醒"),
         BotCommand("clockclear", "取消提醒"),
-        BotCommand("clockclearevery", "取消每日提醒")
+        BotCommand("clockclearevery", "取消每日提醒"),
+        BotCommand("cachestats", "查看响应缓存统计"),
+        BotCommand("usage", "查看API用量统计")
     ]
     application.bot.set_my_commands(commands)
 
@@ -667,13 +724,23 @@ def main() -> None:
     application.add_handler(CommandHandler("clockeveryday", set_daily_clock))
     application.add_handler(CommandHandler("clockclear", clear_clock))
     application.add_handler(CommandHandler("clockclearevery", clear_daily_clock))
+    application.add_handler(CommandHandler("cachestats", cache_stats))
+    application.add_handler(CommandHandler("usage", usage_report))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
 
     # 启动提醒调度任务
     job_queue = application.job_queue
     job_queue.run_repeating(reminder_scheduler, interval=60, first=10)
 
+    # 加载响应缓存并定期保存
+    response_cache.load()
+    job_queue.run_repeating(save_response_cache, interval=300, first=300)
+    # 定期写入用量记录
+    job_queue.run_repeating(flush_usage_ledger, interval=60, first=60)
+
     application.run_polling()
+    response_cache.save()
+    usage_ledger.flush()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -3,4 +3,12 @@ TELEGRAM_BOT_TOKEN = ''
 ALLOWED_USER_IDS = []  # 替换为允许的用户ID
 
 YOUR_SITE_URL = ""  # 可选
-YOUR_APP_NAME = ""  # 可选
\ No newline at end of file
+YOUR_APP_NAME = ""  # 可选
+
+# 响应缓存设置（需在 personalities.py 中为人格设置 "cache": True 才会启用）
+RESPONSE_CACHE_TTL = 86400  # 缓存有效期（秒）
+RESPONSE_CACHE_MAX_BYTES = 4 * 1024 * 1024  # 缓存大小上限（字节）
+RESPONSE_CACHE_PATH = "response_cache.json"  # 缓存持久化文件，设为 None 则不写入磁盘
+
+# 用量记录设置
+USAGE_LEDGER_PATH = "usage_ledger.jsonl"  # 每次API调用的token用量和延迟记录文件，设为 None 则只在内存中统计
@@ -3,7 +3,8 @@ personalities = {
         "api_url": "https://openrouter.ai/api/v1/chat/completions",
         "prompt": "你是chatgpt。",
         "temperature": 0.6,
-        "model": "openai/gpt-4o"
+        "model": "openai/gpt-4o",
+        "cache": False  # 设为 True 以缓存相同请求的响应
     },
     "个性的名字": {
         "api_url": "https://openrouter.ai/api/v1/chat/completions",
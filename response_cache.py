@@ -0,0 +1,138 @@
+import json
+import os
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+# 生成缓存键：对 (模型, 温度, 规范化后的消息) 取哈希
+def make_cache_key(model, temperature, messages):
+    normalized_messages = [
+        {"role": msg.get("role", ""), "content": " ".join(str(msg.get("content", "")).split())}
+        for msg in messages
+    ]
+    raw = json.dumps([model, temperature, normalized_messages], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# 精确匹配的API响应缓存，支持TTL过期、LRU淘汰、按字节限制大小和磁盘持久化
+class ResponseCache:
+    def __init__(self, ttl=86400, max_bytes=4 * 1024 * 1024, path=None):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.path = path
+        # 缓存键 -> (写入时间, 响应JSON, 占用字节数)
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.dirty = False
+
+    # 查找缓存，命中时返回响应JSON，否则返回 None
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        created_at, response_json, size = entry
+        if time.time() - created_at > self.ttl:
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        # 最近使用的条目移到末尾
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return response_json
+
+    # 写入缓存，超过大小限制时淘汰最久未使用的条目
+    def set(self, key, response_json, created_at=None):
+        size = len(key) + len(json.dumps(response_json, ensure_ascii=False).encode("utf-8"))
+        if size > self.max_bytes:
+            logger.debug(f"响应大小 {size} 字节超过缓存上限，跳过缓存")
+            return
+
+        if key in self.entries:
+            self._remove(key)
+
+        self.entries[key] = (created_at if created_at is not None else time.time(), response_json, size)
+        self.total_bytes += size
+        self.dirty = True
+
+        while self.total_bytes > self.max_bytes:
+            oldest_key = next(iter(self.entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, _, size = self.entries.pop(key)
+        self.total_bytes -= size
+        self.dirty = True
+
+    # 返回命中/未命中统计
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    # 从磁盘加载缓存（跳过已过期的条目）
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as err:
+            logger.error(f"加载响应缓存失败: {err}")
+            return
+
+        if not isinstance(data, list):
+            logger.error(f"响应缓存文件格式无效: {self.path}")
+            return
+
+        now = time.time()
+        skipped = 0
+        for row in data:
+            # 每行应为 [缓存键, 写入时间, 响应JSON]
+            if (not isinstance(row, list) or len(row) != 3 or not isinstance(row[0], str)
+                    or not isinstance(row[1], (int, float)) or not isinstance(row[2], dict)):
+                skipped += 1
+                continue
+            key, created_at, response_json = row
+            if now - created_at <= self.ttl:
+                self.set(key, response_json, created_at)
+        if skipped:
+            logger.warning(f"跳过了 {skipped} 条格式无效的响应缓存")
+        # 加载时因大小上限丢弃的条目不计入运行时的淘汰统计
+        self.evictions = 0
+        self.dirty = False
+        logger.info(f"从 {self.path} 加载了 {len(self.entries)} 条响应缓存")
+
+    # 将缓存保存到磁盘（仅在有变更时写入）
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+
+        data = [[key, created_at, response_json] for key, (created_at, response_json, _) in self.entries.items()]
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+            logger.debug(f"已将 {len(data)} 条响应缓存保存到 {self.path}")
+        except OSError as err:
+            logger.error(f"保存响应缓存失败: {err}")
@@ -0,0 +1,183 @@
+import os
+import sys
+import json
+import math
+import time
+import logging
+from collections import deque, defaultdict
+
+logger = logging.getLogger(__name__)
+
+# 每个调用场景保留用于计算百分位数的最近延迟样本数
+LATENCY_SAMPLES = 2000
+# 写入磁盘失败时最多保留的待写入记录数，超出后丢弃最旧的记录
+MAX_PENDING_RECORDS = 10000
+
+
+# 计算百分位数（最近秩法），samples 需已排序
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    index = max(0, math.ceil(pct / 100 * len(samples)) - 1)
+    return samples[index]
+
+
+# 按调用场景、聊天、人格和模型汇总的用量统计
+class UsageSummary:
+    def __init__(self):
+        self.features = defaultdict(lambda: {
+            "calls": 0,
+            "cache_hits": 0,
+            "errors": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "latencies": deque(maxlen=LATENCY_SAMPLES),
+        })
+        self.chats = defaultdict(lambda: [0, 0])
+        self.personalities = defaultdict(lambda: [0, 0])
+        self.models = defaultdict(lambda: [0, 0])
+
+    def add(self, record):
+        feature = self.features[record["call_site"]]
+        feature["calls"] += 1
+        if record.get("cached"):
+            feature["cache_hits"] += 1
+            return
+        if record.get("error"):
+            feature["errors"] += 1
+        else:
+            feature["latencies"].append(record["latency"])
+
+        prompt_tokens = record.get("prompt_tokens", 0)
+        completion_tokens = record.get("completion_tokens", 0)
+        feature["prompt_tokens"] += prompt_tokens
+        feature["completion_tokens"] += completion_tokens
+        for totals, key in ((self.chats, str(record["chat_id"])),
+                            (self.personalities, record["personality"]),
+                            (self.models, record["model"])):
+            totals[key][0] += prompt_tokens
+            totals[key][1] += completion_tokens
+
+    # 生成文本报告
+    def report(self, top=10):
+        if not self.features:
+            return "没有用量记录。"
+
+        lines = ["按功能统计：", "功能 | 调用 | 缓存命中 | 错误 | 输入tokens | 输出tokens | 延迟 p50/p90/p99 (秒)"]
+        for name, feature in sorted(self.features.items()):
+            latencies = sorted(feature["latencies"])
+            lines.append(
+                f"{name} | {feature['calls']} | {feature['cache_hits']} | {feature['errors']} | "
+                f"{feature['prompt_tokens']} | {feature['completion_tokens']} | "
+                f"{percentile(latencies, 50):.2f}/{percentile(latencies, 90):.2f}/{percentile(latencies, 99):.2f}"
+            )
+
+        for title, totals in (("按聊天统计", self.chats), ("按人格统计", self.personalities), ("按模型统计", self.models)):
+            lines.append("")
+            lines.append(f"{title}（输入/输出tokens）：")
+            ranked = sorted(totals.items(), key=lambda item: item[1][0] + item[1][1], reverse=True)
+            for key, (prompt_tokens, completion_tokens) in ranked[:top]:
+                lines.append(f"{key}: {prompt_tokens}/{completion_tokens}")
+
+        return "\n".join(lines)
+
+
+# 记录每次API调用的token用量和延迟，内存中汇总并定期追加写入磁盘
+class UsageLedger:
+    def __init__(self, path=None):
+        self.path = path
+        self.summary = UsageSummary()
+        self.pending = []
+        # 因超出上限而丢弃的记录数（成功写入后清零）
+        self.dropped = 0
+
+    def record(self, call_site, chat_id, personality, model, usage=None, latency=0.0, cached=False, error=False):
+        usage = usage or {}
+        record = {
+            "ts": time.time(),
+            "call_site": call_site,
+            "chat_id": chat_id,
+            "personality": personality,
+            "model": model,
+            "prompt_tokens": 0 if cached else usage.get("prompt_tokens") or 0,
+            "completion_tokens": 0 if cached else usage.get("completion_tokens") or 0,
+            "latency": round(latency, 3),
+            "cached": cached,
+            "error": error,
+        }
+        self.summary.add(record)
+        if self.path:
+            self.pending.append(record)
+            self._trim_pending()
+
+    # 将尚未写入的记录追加到 JSONL 文件
+    def flush(self):
+        if not self.path or not self.pending:
+            return
+
+        records, self.pending = self.pending, []
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            logger.debug(f"已将 {len(records)} 条用量记录写入 {self.path}")
+            if self.dropped:
+                logger.warning(f"用量记录已恢复写入，此前共丢弃了 {self.dropped} 条记录")
+                self.dropped = 0
+        except OSError as err:
+            self.pending = records + self.pending
+            self._trim_pending()
+            logger.error(f"写入用量记录失败: {err}")
+
+    # 限制待写入记录的数量，避免磁盘持续不可写时内存无限增长
+    def _trim_pending(self):
+        overflow = len(self.pending) - MAX_PENDING_RECORDS
+        if overflow > 0:
+            del self.pending[:overflow]
+            if not self.dropped:
+                logger.warning(f"待写入的用量记录超过 {MAX_PENDING_RECORDS} 条，开始丢弃最旧的记录")
+            self.dropped += overflow
+
+
+# 从 JSONL 文件读取用量记录并生成汇总
+def load_summary(path, since=None):
+    summary = UsageSummary()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if since is None or record.get("ts", 0) >= since:
+                summary.add(record)
+    return summary
+
+
+# 命令行报告：python usage_ledger.py [用量文件] [最近天数]
+if __name__ == "__main__":
+    from config import USAGE_LEDGER_PATH
+
+    usage = "用法: python usage_ledger.py [用量文件] [最近天数]"
+    path = sys.argv[1] if len(sys.argv) > 1 else USAGE_LEDGER_PATH
+    if not path:
+        print(f"未配置用量记录文件（USAGE_LEDGER_PATH 为 None），请指定文件路径。\n{usage}", file=sys.stderr)
+        sys.exit(1)
+    if not os.path.exists(path):
+        print(f"用量记录文件不存在: {path}（机器人尚未写入任何记录？）\n{usage}", file=sys.stderr)
+        sys.exit(1)
+
+    since = None
+    if len(sys.argv) > 2:
+        try:
+            days = float(sys.argv[2])
+        except ValueError:
+            days = None
+        if days is None or not math.isfinite(days) or days < 0:
+            print(f"无效的天数: {sys.argv[2]}\n{usage}", file=sys.stderr)
+            sys.exit(1)
+        since = time.time() - days * 86400
+
+    print(load_summary(path, since).report(top=20))